@@ -2,32 +2,45 @@
 """
 Facebook Ads Historical Data Backfill Script
 
-Fetches Facebook Ads data for a historical date range and exports to CSV.
-The CSV can then be loaded to BigQuery using load_csv_to_bq.py
+Fetches Facebook Ads data for a historical date range and exports to CSV
+(or Parquet). The file can then be loaded to BigQuery using load_csv_to_bq.py
 
 Usage:
     python backfill.py --start-date 2025-11-25 --end-date 2025-12-31
+    python backfill.py --start-date 2025-11-25 --end-date 2025-12-31 --format parquet
 
 Features:
-- Fetches data day-by-day for specified date range
-- Handles multiple ad accounts
+- Fetches daily rows for the whole date range in one request per account
+- Handles multiple ad accounts, fetching them concurrently
 - Deduplicates records automatically
 - Exports to CSV for review before loading to BigQuery
+- Optional typed Parquet export for faster, schema-exact BigQuery loads
 - Comprehensive error handling and progress tracking
 """
 
 import os
 import sys
 import json
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import argparse
+import logging
 import csv
-from datetime import datetime, timedelta
+import gzip
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # =============================================================================
 # CONFIGURATION - Update these for your client
 # =============================================================================
@@ -41,11 +54,77 @@ ACCOUNT_IDS = [
     "950565439763291"
 ]
 
+# Shared HTTP session: keeps TCP/TLS connections to graph.facebook.com alive
+# across accounts and pages, and retries throttled/5xx responses with
+# exponential backoff (honoring Retry-After)
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+        allowed_methods=["GET"]
+    )
+))
+
+# Upper bound on account fetches in flight at once
+MAX_WORKERS = 8
+
+# Write buffer for the CSV export (1 MiB) to keep write() syscalls rare
+CSV_BUFFER_SIZE = 1 << 20
+
+# gzip level for --gzip CSV exports; low levels get most of the size win cheaply
+GZIP_COMPRESSLEVEL = 3
+
+# Rows per Arrow batch when writing Parquet
+PARQUET_BATCH_SIZE = 10000
+
+# Back off when Facebook reports we've used this much of a rate-limit bucket (%)
+USAGE_THROTTLE_PCT = 90
+THROTTLE_SLEEP_SECONDS = 30
+
 
 # =============================================================================
 # FACEBOOK API FUNCTIONS
 # =============================================================================
 
+def throttle_on_usage(resp):
+    """
+    Pause when Facebook's rate-limit headers show a bucket is nearly exhausted.
+
+    Reads X-App-Usage and X-Business-Use-Case-Usage (percent of quota used)
+    so concurrent workers slow down before Facebook starts rejecting calls.
+    """
+    usage = 0
+    wait_minutes = 0
+    try:
+        app_usage = resp.headers.get("X-App-Usage")
+        if app_usage:
+            usage = max([usage, *json.loads(app_usage).values()])
+
+        buc_usage = resp.headers.get("X-Business-Use-Case-Usage")
+        if buc_usage:
+            for entries in json.loads(buc_usage).values():
+                for entry in entries:
+                    usage = max(
+                        usage,
+                        entry.get("call_count", 0),
+                        entry.get("total_cputime", 0),
+                        entry.get("total_time", 0)
+                    )
+                    wait_minutes = max(wait_minutes, entry.get("estimated_time_to_regain_access", 0))
+    except (ValueError, TypeError, AttributeError):
+        return
+
+    if usage >= USAGE_THROTTLE_PCT or wait_minutes:
+        delay = max(THROTTLE_SLEEP_SECONDS, wait_minutes * 60)
+        logger.warning(f"    ⏳ Rate limit usage at {usage}%, pausing {delay}s...")
+        time.sleep(delay)
+
+
 def fetch_insights_for_date_range(token, account_id, start_date, end_date):
     """
     Fetch Facebook Ads insights for a specific date range.
@@ -79,42 +158,34 @@ def fetch_insights_for_date_range(token, account_id, start_date, end_date):
         "level": "ad",
         "breakdowns": json.dumps(["publisher_platform"]),
         "time_increment": "1",
-        "date_start": start_date,
-        "date_stop": end_date
+        "time_range": json.dumps({"since": start_date, "until": end_date})
     }
 
     all_data = []
-    max_retries = 3
     timeout = 30
 
     while url:
-        for attempt in range(max_retries):
-            try:
-                print(f"    Fetching {start_date} to {end_date} (attempt {attempt + 1}/{max_retries})")
-                resp = requests.get(url, params=params, timeout=timeout)
-                resp.raise_for_status()
-                result = resp.json()
-
-                if "error" in result:
-                    error_msg = result["error"].get("message", "Unknown error")
-                    error_code = result["error"].get("code", "Unknown")
-                    print(f"    ❌ Error [{error_code}]: {error_msg}")
-                    raise RuntimeError(f"Facebook API Error [{error_code}]: {error_msg}")
-
-                page = result.get("data", [])
-                if page:
-                    all_data.extend(page)
-                    print(f"    ✅ Fetched {len(page)} records")
-
-                url = result.get("paging", {}).get("next")
-                params = {}
-                break
-
-            except requests.RequestException as e:
-                if attempt == max_retries - 1:
-                    raise
-                print(f"    ⚠️ Retry {attempt + 1}/{max_retries}...")
-                continue
+        logger.debug("    Fetching %s to %s", start_date, end_date)
+        # Stream the body and hand the raw bytes to orjson in one read,
+        # skipping requests' chunked .content buffering
+        with SESSION.get(url, params=params, timeout=timeout, stream=True) as resp:
+            resp.raise_for_status()
+            result = orjson.loads(resp.raw.read(decode_content=True))
+        throttle_on_usage(resp)
+
+        if "error" in result:
+            error_msg = result["error"].get("message", "Unknown error")
+            error_code = result["error"].get("code", "Unknown")
+            logger.error(f"    ❌ Error [{error_code}]: {error_msg}")
+            raise RuntimeError(f"Facebook API Error [{error_code}]: {error_msg}")
+
+        page = result.get("data", [])
+        if page:
+            all_data.extend(page)
+            logger.debug("    ✅ Fetched %d records", len(page))
+
+        url = result.get("paging", {}).get("next")
+        params = {}
 
     return all_data
 
@@ -123,172 +194,260 @@ def fetch_insights_for_date_range(token, account_id, start_date, end_date):
 # DATA PROCESSING
 # =============================================================================
 
-def extract_metric(rec, key, is_float=False):
-    """Extract metric value from nested Facebook API response."""
-    val = rec.get(key, 0)
-    if isinstance(val, list):
-        raw = val[0].get("value", 0) if val else 0
-    else:
-        raw = val
-    return float(raw) if is_float else int(raw)
+# Video metrics arrive as [{"action_type": ..., "value": ...}] lists; each is
+# reduced to its first value and cast with the paired type
+VIDEO_METRICS = [
+    ("video_continuous_2_sec_watched_actions", int),
+    ("video_30_sec_watched_actions", int),
+    ("video_avg_time_watched_actions", float),
+    ("video_p25_watched_actions", int),
+    ("video_p50_watched_actions", int),
+    ("video_p75_watched_actions", int),
+    ("video_p100_watched_actions", int),
+]
+
+# Fixed columns emitted by flatten_record, in CSV order (action columns follow)
+BASE_COLUMNS = [
+    "campaign_name", "ad_name", "impressions", "clicks", "spend",
+    "date_start", "date_stop", "publisher_platform",
+] + [key for key, _ in VIDEO_METRICS]
+
 
+# Parquet types for the fixed columns; action columns are always INT64
+PARQUET_COLUMN_TYPES = {
+    "campaign_name": pa.string(),
+    "ad_name": pa.string(),
+    "impressions": pa.int64(),
+    "clicks": pa.int64(),
+    "spend": pa.float64(),
+    "date_start": pa.date32(),
+    "date_stop": pa.date32(),
+    "publisher_platform": pa.string(),
+    **{key: pa.float64() if cast is float else pa.int64() for key, cast in VIDEO_METRICS},
+}
 
-def flatten_record(rec, action_types):
+
+def flatten_record(rec, action_zeros, action_index):
     """
-    Flatten nested Facebook API response into a flat dictionary.
+    Flatten nested Facebook API response into a row list in column order:
+    BASE_COLUMNS followed by the run's action columns.
     Matches the schema used by main.py for consistency.
-    """
-    flat = {
-        "campaign_name": rec.get("campaign_name"),
-        "ad_name": rec.get("ad_name"),
-        "impressions": int(rec.get("impressions", 0)),
-        "clicks": int(rec.get("clicks", 0)),
-        "spend": float(rec.get("spend", 0)),
-        "date_start": rec.get("date_start"),
-        "date_stop": rec.get("date_stop"),
-        "publisher_platform": rec.get("publisher_platform"),
-        "video_continuous_2_sec_watched_actions": extract_metric(rec, "video_continuous_2_sec_watched_actions"),
-        "video_30_sec_watched_actions": extract_metric(rec, "video_30_sec_watched_actions"),
-        "video_avg_time_watched_actions": extract_metric(rec, "video_avg_time_watched_actions", is_float=True),
-        "video_p25_watched_actions": extract_metric(rec, "video_p25_watched_actions"),
-        "video_p50_watched_actions": extract_metric(rec, "video_p50_watched_actions"),
-        "video_p75_watched_actions": extract_metric(rec, "video_p75_watched_actions"),
-        "video_p100_watched_actions": extract_metric(rec, "video_p100_watched_actions"),
-    }
 
-    # Initialize all action types with 0
-    for at in action_types:
-        col = at.replace(".", "_")
-        if col not in flat:
-            flat[col] = 0
+    Rows are plain lists rather than dicts, so they take less memory and go
+    straight to csv.writer without a per-field lookup. Video metrics are
+    unpacked in a single table-driven loop. action_zeros holds one 0 per
+    action column, and action_index maps each action type to its position in
+    the row. Both are computed once per run.
+    """
+    get = rec.get
+    row = [
+        get("campaign_name"),
+        get("ad_name"),
+        int(get("impressions", 0)),
+        int(get("clicks", 0)),
+        float(get("spend", 0)),
+        get("date_start"),
+        get("date_stop"),
+        get("publisher_platform"),
+    ]
+
+    for key, cast in VIDEO_METRICS:
+        val = get(key, 0)
+        if type(val) is list:
+            val = val[0].get("value", 0) if val else 0
+        row.append(cast(val))
 
     # Fill in actual action values
-    for act in rec.get("actions", []):
-        col = act["action_type"].replace(".", "_")
-        flat[col] = int(act.get("value", 0))
+    row.extend(action_zeros)
+    for act in get("actions") or ():
+        row[action_index[act["action_type"]]] = int(act.get("value", 0))
+
+    return row
 
-    return flat
+
+def write_parquet(filename, rows, fieldnames, batch_size=PARQUET_BATCH_SIZE):
+    """
+    Write flattened row lists (ordered as fieldnames) to a snappy-compressed
+    Parquet file.
+
+    Columns are typed up front (dates as DATE, counts as INT64), so BigQuery
+    loads the file without schema autodetection or text re-parsing. Rows are
+    converted in batches so only batch_size of them are held as Arrow data.
+    """
+    schema = pa.schema([(name, PARQUET_COLUMN_TYPES.get(name, pa.int64())) for name in fieldnames])
+    # Dates arrive as YYYY-MM-DD strings and are cast to DATE per batch
+    source_schema = pa.schema([
+        (field.name, pa.string() if field.type == pa.date32() else field.type)
+        for field in schema
+    ])
+
+    def to_table(batch):
+        columns = [
+            pa.array(values, type=field.type)
+            for values, field in zip(zip(*batch), source_schema)
+        ]
+        return pa.Table.from_arrays(columns, schema=source_schema).cast(schema)
+
+    with pq.ParquetWriter(filename, schema, compression="snappy") as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer.write_table(to_table(batch))
+                batch = []
+        if batch:
+            writer.write_table(to_table(batch))
 
 
 # =============================================================================
 # MAIN BACKFILL LOGIC
 # =============================================================================
 
-def backfill(start_date, end_date):
+def backfill(start_date, end_date, output_format="csv", compress=False):
     """
     Backfill data from start_date to end_date (inclusive).
 
-    Fetches data day-by-day, deduplicates, and exports to CSV.
+    Fetches daily rows per account (concurrently), deduplicates, and exports
+    to CSV or, with output_format="parquet", to a typed Parquet file.
+    With compress=True the CSV is gzipped, cutting upload size to BigQuery.
     """
     if not FB_TOKEN:
-        print("❌ Error: FB_TOKEN not found in .env file")
-        print("   Please create a .env file with your Facebook access token")
+        logger.error("❌ Error: FB_TOKEN not found in .env file")
+        logger.error("   Please create a .env file with your Facebook access token")
         sys.exit(1)
 
-    print("=" * 80)
-    print("Facebook Ads Historical Data Backfill")
-    print("=" * 80)
-    print(f"📅 Date range: {start_date} to {end_date}")
-    print(f"📊 Accounts: {len(ACCOUNT_IDS)}")
-    print()
+    logger.info("=" * 80)
+    logger.info("Facebook Ads Historical Data Backfill")
+    logger.info("=" * 80)
+    logger.info(f"📅 Date range: {start_date} to {end_date}")
+    logger.info(f"📊 Accounts: {len(ACCOUNT_IDS)}")
+    logger.info("")
 
     # Parse dates
     try:
         start = datetime.strptime(start_date, "%Y-%m-%d")
         end = datetime.strptime(end_date, "%Y-%m-%d")
     except ValueError as e:
-        print(f"❌ Invalid date format: {e}")
-        print("   Expected format: YYYY-MM-DD")
+        logger.error(f"❌ Invalid date format: {e}")
+        logger.error("   Expected format: YYYY-MM-DD")
         sys.exit(1)
 
     if start > end:
-        print("❌ Error: start_date must be <= end_date")
+        logger.error("❌ Error: start_date must be <= end_date")
         sys.exit(1)
 
-    all_raw = []
-    current_date = start
+    # One range request per account; time_increment=1 returns a row per day
+    # Never start more threads than there are accounts to fetch
+    workers = max(1, min(MAX_WORKERS, len(ACCOUNT_IDS)))
+    logger.info(f"📊 Fetching {len(ACCOUNT_IDS)} account(s) ({workers} at a time)...")
 
-    # Fetch data for each day
-    while current_date <= end:
-        date_str = current_date.strftime("%Y-%m-%d")
-        print(f"📊 Fetching {date_str}...")
-
-        for account_id in ACCOUNT_IDS:
+    # Deduplicate as each account's records are collected so only unique
+    # records are held, gathering action types for a consistent schema in the
+    # same pass. Accounts are consumed in order, keeping the first-seen record
+    # (and the output order) stable between runs.
+    unique = {}
+    action_types = set()
+    total_fetched = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (account_id, executor.submit(fetch_insights_for_date_range, FB_TOKEN, account_id, start_date, end_date))
+            for account_id in ACCOUNT_IDS
+        ]
+        for account_id, future in futures:
             try:
-                print(f"  Account {account_id}:")
-                raw = fetch_insights_for_date_range(
-                    FB_TOKEN,
-                    account_id,
-                    date_str,
-                    date_str
-                )
-                all_raw.extend(raw)
-                print(f"  ✅ Total: {len(raw)} records")
+                raw = future.result()
             except Exception as e:
-                print(f"  ❌ Failed: {e}")
-
-        current_date += timedelta(days=1)
+                logger.error(f"  ❌ Account {account_id} failed: {e}")
+                continue
 
-    if not all_raw:
-        print("\n⚠️ No data fetched")
+            logger.info(f"  ✅ Account {account_id}: {len(raw)} records")
+            total_fetched += len(raw)
+            for rec in raw:
+                # Unique key: (campaign_name, ad_name, date_start, publisher_platform)
+                key = (rec.get('campaign_name'), rec.get('ad_name'), rec.get('date_start'), rec.get('publisher_platform'))
+                if key not in unique:
+                    unique[key] = rec
+                    for act in rec.get("actions", []):
+                        action_types.add(act["action_type"])
+
+    if not unique:
+        logger.warning("\n⚠️ No data fetched")
         return
 
-    # Deduplicate raw records
-    print(f"\n🔄 Processing {len(all_raw)} records...")
-    print(f"🔍 Deduplicating records...")
-
-    # Create unique key for each record
-    seen = set()
-    deduped_raw = []
-    for rec in all_raw:
-        # Unique key: campaign_name|ad_name|date_start|publisher_platform
-        key = f"{rec.get('campaign_name')}|{rec.get('ad_name')}|{rec.get('date_start')}|{rec.get('publisher_platform')}"
-        if key not in seen:
-            seen.add(key)
-            deduped_raw.append(rec)
+    duplicates_removed = total_fetched - len(unique)
+    logger.info(f"\n🔄 Processing {total_fetched} records...")
+    logger.info(f"  Removed {duplicates_removed} duplicate records ({len(unique)} unique)")
+
+    # Map each action type to its column name once; action columns are sorted
+    # so the header order is the same on every run
+    action_col_map = {at: at.replace(".", "_") for at in action_types}
+    action_columns = sorted(set(action_col_map.values()) - set(BASE_COLUMNS))
+    fieldnames = BASE_COLUMNS + action_columns
+    column_index = {col: i for i, col in enumerate(fieldnames)}
+    action_index = {at: column_index[col] for at, col in action_col_map.items()}
+    action_zeros = [0] * len(action_columns)
+    date_start_index = column_index["date_start"]
+
+    # Flatten and write one record at a time so rows are never materialized
+    # as a list. time_range bounds the API response, but any row dated
+    # outside it (or undated) is skipped rather than exported.
+    skipped = []
+
+    def emit_rows():
+        for rec in unique.values():
+            row = flatten_record(rec, action_zeros, action_index)
+            date_start = row[date_start_index]
+            if date_start is None or not start_date <= date_start <= end_date:
+                skipped.append(date_start)
+                continue
+            yield row
 
-    duplicates_removed = len(all_raw) - len(deduped_raw)
-    print(f"  Removed {duplicates_removed} duplicate records ({len(deduped_raw)} unique)")
+    output_filename = f"backfill_{start_date}_to_{end_date}.{output_format}"
+    if compress and output_format == "csv":
+        output_filename += ".gz"
+    logger.info(f"\n📤 Writing rows for {start_date} to {end_date} to {output_filename}...")
 
-    # Collect all action types for consistent schema
-    action_types = set()
-    for rec in deduped_raw:
-        for act in rec.get("actions", []):
-            action_types.add(act["action_type"])
-
-    # Flatten all records
-    rows = [flatten_record(rec, action_types) for rec in deduped_raw]
-
-    # Filter to only requested date range
-    print(f"📋 Filtering to date range {start_date} to {end_date}...")
-    rows_before = len(rows)
-    rows = [row for row in rows if start_date <= row["date_start"] <= end_date]
-    rows_after = len(rows)
-    filtered_count = rows_before - rows_after
-    if filtered_count > 0:
-        print(f"  Filtered from {rows_before} to {rows_after} rows ({filtered_count} outside range removed)")
-
-    if not rows:
-        print("\n⚠️ No data in requested date range")
+    # Write under a temporary name and rename only once the file is complete,
+    # so a failed export never leaves a truncated backfill_* file behind for
+    # load_csv_to_bq.py to pick up
+    tmp_filename = f"{output_filename}.tmp"
+    try:
+        if output_format == "parquet":
+            write_parquet(tmp_filename, emit_rows(), fieldnames)
+        else:
+            if compress:
+                f = gzip.open(tmp_filename, 'wt', newline='', compresslevel=GZIP_COMPRESSLEVEL)
+            else:
+                f = open(tmp_filename, 'w', newline='', buffering=CSV_BUFFER_SIZE)
+            with f:
+                writer = csv.writer(f)
+                writer.writerow(fieldnames)
+                writer.writerows(emit_rows())
+    except BaseException:
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
+        raise
+
+    if skipped:
+        logger.warning(f"⚠️ Skipped {len(skipped)} row(s) dated outside {start_date} to {end_date}: {sorted(set(map(str, skipped)))}")
+
+    # A header-only file would just be picked up and loaded as empty
+    if len(skipped) == len(unique):
+        os.remove(tmp_filename)
+        logger.warning("\n⚠️ No data in requested date range")
         return
 
-    # Export to CSV
-    csv_filename = f"backfill_{start_date}_to_{end_date}.csv"
-    print(f"\n📤 Writing {len(rows)} rows to {csv_filename}...")
-
-    with open(csv_filename, 'w', newline='') as f:
-        if rows:
-            writer = csv.DictWriter(f, fieldnames=rows[0].keys())
-            writer.writeheader()
-            writer.writerows(rows)
+    os.replace(tmp_filename, output_filename)
 
-    print("=" * 80)
-    print(f"✅ Successfully exported {len(rows)} rows to {csv_filename}")
-    print()
-    print("Next steps:")
-    print(f"  1. Review the CSV file: {csv_filename}")
-    print(f"  2. Load to BigQuery: python load_csv_to_bq.py")
-    print("=" * 80)
+    logger.info("=" * 80)
+    logger.info(f"✅ Successfully exported {len(unique) - len(skipped)} rows to {output_filename}")
+    logger.info("")
+    logger.info("Next steps:")
+    logger.info(f"  1. Review the {output_format.upper()} file: {output_filename}")
+    logger.info(f"  2. Load to BigQuery: python load_csv_to_bq.py {output_filename}")
+    logger.info("=" * 80)
 
 
 # =============================================================================
@@ -309,10 +468,23 @@ Examples:
 
   # Backfill single day
   python backfill.py --start-date 2025-12-15 --end-date 2025-12-15
+
+  # Export typed Parquet instead of CSV
+  python backfill.py --start-date 2025-11-01 --end-date 2025-11-30 --format parquet
+
+  # Export gzip-compressed CSV (smaller upload to BigQuery)
+  python backfill.py --start-date 2025-11-01 --end-date 2025-11-30 --gzip
         """
     )
     parser.add_argument("--start-date", required=True, help="Start date (YYYY-MM-DD)")
     parser.add_argument("--end-date", required=True, help="End date (YYYY-MM-DD)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="Output file format (default: csv)")
+    parser.add_argument("--gzip", action="store_true", help="Gzip-compress the CSV output (.csv.gz)")
 
     args = parser.parse_args()
-    backfill(args.start_date, args.end_date)
+    if args.gzip and args.format != "csv":
+        parser.error("--gzip only applies to CSV output; Parquet is already snappy-compressed")
+
+    # Progress goes to stderr; set LOG_LEVEL=DEBUG to see per-page fetch detail
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+    backfill(args.start_date, args.end_date, args.format, args.gzip)
@@ -0,0 +1,44 @@
+"""
+Arrow helpers shared by main.py and load_csv_to_bq.py for Parquet loads.
+
+Kept free of the pipeline's clients and configuration so the standalone
+scripts can import it without pulling in main.py.
+"""
+
+import pyarrow as pa
+
+# Arrow type for each BigQuery column type we cast Parquet columns to
+BQ_TO_ARROW_TYPES = {
+    "STRING": pa.string(),
+    "INTEGER": pa.int64(),
+    "INT64": pa.int64(),
+    "FLOAT": pa.float64(),
+    "FLOAT64": pa.float64(),
+    "DATE": pa.date32(),
+}
+
+
+def cast_to_table_types(client, arrow_table, table_id):
+    """
+    Cast an Arrow table's columns to the types the BigQuery table already uses.
+
+    BigQuery rejects Parquet loads whose column types or modes differ from
+    the table (e.g. INT64 action counts into a FLOAT column, or an optional
+    column into a REQUIRED one), so matching columns are cast and REQUIRED
+    columns are written non-nullable. Columns the table doesn't have yet keep
+    their Arrow type. Raises google.api_core.exceptions.NotFound if the table
+    doesn't exist.
+    """
+    table_fields = {field.name: field for field in client.get_table(table_id).schema}
+    fields = []
+    for field in arrow_table.schema:
+        bq_field = table_fields.get(field.name)
+        if bq_field is None:
+            fields.append(field)
+        else:
+            fields.append(pa.field(
+                field.name,
+                BQ_TO_ARROW_TYPES.get(bq_field.field_type, field.type),
+                nullable=bq_field.mode != "REQUIRED",
+            ))
+    return arrow_table.cast(pa.schema(fields))
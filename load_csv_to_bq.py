@@ -2,26 +2,36 @@
 """
 Load CSV data to BigQuery table
 
-This script loads a CSV file (typically from backfill.py) into a BigQuery table.
-It automatically detects the schema and appends data to the existing table.
+This script loads a CSV or Parquet file (typically from backfill.py) into a
+BigQuery table. CSV schemas are auto-detected; Parquet files carry their own
+types and are aligned to the existing table before loading. Data is appended
+to the existing table.
 
 Usage:
-    python load_csv_to_bq.py                    # Loads the most recent backfill_*.csv
+    python load_csv_to_bq.py                    # Loads the most recent backfill_* file
     python load_csv_to_bq.py mydata.csv         # Loads a specific CSV file
+    python load_csv_to_bq.py mydata.parquet     # Loads a specific Parquet file
+    python load_csv_to_bq.py mydata.csv.gz      # Loads a gzip-compressed CSV
 
 Features:
 - Auto-detects CSV schema
+- Loads typed Parquet without autodetection or header handling
+- Uploads gzip-compressed CSV as-is (BigQuery decompresses it)
 - Appends to existing table (WRITE_APPEND)
 - Skips header row automatically
 - Shows progress and confirms row counts
 - Validates file exists before loading
 """
 
+import io
 import os
 import sys
 import glob
+import pyarrow.parquet as pq
+from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
 from dotenv import load_dotenv
+from bq_arrow import cast_to_table_types
 
 # Load environment variables from .env file
 load_dotenv()
@@ -38,6 +48,24 @@ BQ_TABLE = os.getenv("BQ_TABLE", "your-project.your_dataset.ad_data")
 # BIGQUERY LOADING
 # =============================================================================
 
+def align_parquet_to_table(client, parquet_file, table_id):
+    """
+    Cast Parquet columns to the types the destination table already uses
+    (see bq_arrow.cast_to_table_types). New tables take the file as-is.
+
+    Returns a binary file object ready for load_table_from_file.
+    """
+    try:
+        table = cast_to_table_types(client, pq.read_table(parquet_file), table_id)
+    except NotFound:
+        return open(parquet_file, "rb")
+
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression="snappy")
+    buf.seek(0)
+    return buf
+
+
 def load_csv_to_bigquery(csv_file):
     """
     Load CSV file to BigQuery table.
@@ -48,7 +76,7 @@ def load_csv_to_bigquery(csv_file):
     The function will:
     1. Validate the file exists
     2. Parse the table name into project/dataset/table
-    3. Configure BigQuery load job with auto-detection
+    3. Configure BigQuery load job (CSV auto-detection, or typed Parquet)
     4. Load the data and wait for completion
     5. Display row counts
     """
@@ -83,16 +111,27 @@ def load_csv_to_bigquery(csv_file):
         sys.exit(1)
 
     # Configure load job
-    job_config = bigquery.LoadJobConfig(
-        source_format=bigquery.SourceFormat.CSV,
-        skip_leading_rows=1,  # Skip header row
-        autodetect=True,      # Auto-detect schema from CSV
-        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,  # Append to existing table
-    )
+    if csv_file.endswith(".parquet"):
+        # Parquet is typed, so no autodetect or header handling is needed
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,  # Append to existing table
+            schema_update_options=[bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION],
+        )
+        source = align_parquet_to_table(client, csv_file, full_table_id)
+    else:
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.CSV,
+            skip_leading_rows=1,  # Skip header row
+            autodetect=True,      # Auto-detect schema from CSV
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,  # Append to existing table
+        )
+        # .csv.gz is uploaded compressed; BigQuery detects gzip on load
+        source = open(csv_file, "rb")
 
     # Load the file
     print(f"📤 Loading {csv_file} to {full_table_id}...")
-    with open(csv_file, "rb") as f:
+    with source as f:
         load_job = client.load_table_from_file(
             f,
             full_table_id,
@@ -128,21 +167,26 @@ if __name__ == "__main__":
         # User specified a file
         csv_file = sys.argv[1]
     else:
-        # Find the most recent backfill_*.csv file
-        csv_files = sorted(glob.glob("backfill_*.csv"), reverse=True)
+        # Find the most recent backfill_*.csv / .csv.gz / .parquet file
+        csv_files = sorted(
+            glob.glob("backfill_*.csv") + glob.glob("backfill_*.csv.gz") + glob.glob("backfill_*.parquet"),
+            key=os.path.getmtime,
+            reverse=True
+        )
 
         if not csv_files:
-            print("❌ No backfill CSV files found")
+            print("❌ No backfill CSV or Parquet files found")
             print()
             print("Usage:")
-            print("  python load_csv_to_bq.py               # Load most recent backfill_*.csv")
-            print("  python load_csv_to_bq.py mydata.csv    # Load specific CSV file")
+            print("  python load_csv_to_bq.py                  # Load most recent backfill_* file")
+            print("  python load_csv_to_bq.py mydata.csv       # Load specific CSV file")
+            print("  python load_csv_to_bq.py mydata.parquet   # Load specific Parquet file")
             sys.exit(1)
 
         csv_file = csv_files[0]
 
         if len(csv_files) > 1:
-            print(f"⚠️ Multiple CSV files found:")
+            print(f"⚠️ Multiple backfill files found:")
             for f in csv_files[:5]:  # Show first 5
                 print(f"   - {f}")
             print(f"Using most recent: {csv_file}")
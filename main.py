@@ -16,18 +16,39 @@ Features:
 
 import os
 import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.util.retry import Retry
 import json
+import logging
+import orjson
 import csv
-from datetime import datetime, timedelta
+import hashlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
-from google.cloud import bigquery, secretmanager
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bq_arrow import cast_to_table_types
+from google.cloud import bigquery, bigquery_storage_v1, secretmanager
+from google.cloud.bigquery_storage_v1 import types as bqs_types, writer as bqs_writer
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Progress goes to stderr through logging (Cloud Logging batches it); set
+# LOG_LEVEL=DEBUG to see per-page fetch detail
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+logger = logging.getLogger(__name__)
+
 # Lazy-initialized clients (to avoid gRPC timeout warnings when not used)
 _bq_client = None
 _sm_client = None
+_bq_write_client = None
 
 
 def get_bq_client():
@@ -43,6 +64,30 @@ def get_sm_client():
         _sm_client = secretmanager.SecretManagerServiceClient()
     return _sm_client
 
+
+def get_bq_write_client():
+    global _bq_write_client
+    if _bq_write_client is None:
+        _bq_write_client = bigquery_storage_v1.BigQueryWriteClient()
+    return _bq_write_client
+
+
+# Shared HTTP session: keeps TCP/TLS connections to graph.facebook.com alive
+# across accounts and pages, and retries throttled/5xx responses with
+# exponential backoff (honoring Retry-After)
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=64,
+    max_retries=Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+        allowed_methods=["GET"]
+    )
+))
+
 # =============================================================================
 # CONFIGURATION - Update these for your client
 # =============================================================================
@@ -63,6 +108,43 @@ TOKEN_METADATA_SECRET_NAME = "fb-marketing-token-metadata"
 FB_APP_ID_SECRET = "fb-app-id"
 FB_APP_SECRET_SECRET = "fb-app-secret"
 
+# Refresh long-lived tokens this many days before they expire
+TOKEN_REFRESH_DAYS = 7
+
+# Local record of the last validated token (by fingerprint), so warm runs skip
+# the app-credential lookups and the debug_token round-trip. Entries are
+# trusted for TOKEN_CACHE_TTL seconds, only while Secret Manager still holds
+# that token, and never once it is inside the refresh window.
+TOKEN_CACHE_PATH = os.getenv("TOKEN_CACHE_PATH", "/tmp/fb_token.json")
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", str(6 * 60 * 60)))
+
+# Accounts fetched from Facebook in parallel. Kept modest so concurrent
+# calls don't trip Facebook's per-app rate limits (error 80004)
+FB_CONCURRENCY = int(os.getenv("FB_CONCURRENCY", "4"))
+
+# Runs with at least this many rows use a (free) batch load job instead of
+# streaming inserts
+BQ_LOAD_THRESHOLD = int(os.getenv("BQ_LOAD_THRESHOLD", "10000"))
+
+# Rows per BigQuery streaming insert request (API hard limit is 50,000;
+# Google recommends ~500)
+BQ_BATCH_SIZE = int(os.getenv("BQ_BATCH_SIZE", "500"))
+
+# Serialize streaming insert payloads with orjson instead of the client's
+# stdlib json encoding
+USE_ORJSON = os.getenv("USE_ORJSON", "false").lower() == "true"
+
+# Insert through the BigQuery Storage Write API (gRPC + protobuf, default
+# stream) instead of streaming inserts / load jobs
+USE_STORAGE_WRITE = os.getenv("USE_STORAGE_WRITE", "false").lower() == "true"
+
+# Load rows with an in-memory Parquet batch load job instead of streaming
+# inserts / NDJSON load jobs
+USE_PARQUET_LOAD = os.getenv("USE_PARQUET_LOAD", "false").lower() == "true"
+
+# Target size of each Storage Write AppendRowsRequest (API limit is 10 MB)
+STORAGE_WRITE_REQUEST_BYTES = 5 * 1024 * 1024
+
 
 # =============================================================================
 # SECRET MANAGER FUNCTIONS
@@ -87,7 +169,7 @@ def set_secret(secret_id: str, value: str):
             "payload": {"data": value.encode("UTF-8")}
         }
     )
-    print(f"✅ Updated secret: {secret_id}")
+    logger.info(f"✅ Updated secret: {secret_id}")
 
 
 # =============================================================================
@@ -108,7 +190,7 @@ def debug_token(token: str, app_id: str, app_secret: str) -> dict:
     try:
         resp = requests.get(url, params=params, timeout=10)
         resp.raise_for_status()
-        data = resp.json().get("data", {})
+        data = orjson.loads(resp.content).get("data", {})
 
         return {
             "is_valid": data.get("is_valid", False),
@@ -146,7 +228,7 @@ def refresh_long_lived_token(current_token: str, app_id: str, app_secret: str) -
 
     resp = requests.get(url, params=params, timeout=30)
     resp.raise_for_status()
-    data = resp.json()
+    data = orjson.loads(resp.content)
 
     new_token = data["access_token"]
     expires_in = data.get("expires_in", 60 * 24 * 60 * 60)
@@ -155,6 +237,63 @@ def refresh_long_lived_token(current_token: str, app_id: str, app_secret: str) -
     return new_token, expires_at
 
 
+def token_fingerprint(token: str) -> str:
+    """Hash identifying a token, so the cache never has to store the token itself."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def load_cached_token(token: str) -> bool:
+    """
+    Return True if token (as just read from Secret Manager) is the one the
+    local cache validated within TOKEN_CACHE_TTL and isn't yet due for
+    refresh. A token rotated in Secret Manager never matches.
+    """
+    try:
+        with open(TOKEN_CACHE_PATH) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if cache.get("fingerprint") != token_fingerprint(token):
+        return False
+
+    now = time.time()
+    if now - cache.get("validated_at", 0) > TOKEN_CACHE_TTL:
+        return False
+
+    # expires_at = 0 means never expires (system user token)
+    expires_at = cache.get("expires_at", 0)
+    if expires_at and expires_at - now <= TOKEN_REFRESH_DAYS * 24 * 60 * 60:
+        return False
+
+    return True
+
+
+def save_cached_token(token: str, expires_at: int):
+    """Record a freshly validated token in the local cache (best effort)."""
+    data = json.dumps({
+        "fingerprint": token_fingerprint(token),
+        "expires_at": expires_at,
+        "validated_at": int(time.time())
+    })
+    tmp_path = f"{TOKEN_CACHE_PATH}.tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, TOKEN_CACHE_PATH)
+    except OSError:
+        pass  # Cache is optional
+
+
+def clear_cached_token():
+    """Drop the cached token, e.g. after Facebook rejects it."""
+    try:
+        os.remove(TOKEN_CACHE_PATH)
+    except OSError:
+        pass
+
+
 def get_valid_token() -> str:
     """
     Main token management function. Gets token from Secret Manager,
@@ -163,26 +302,33 @@ def get_valid_token() -> str:
     # First check for env var override (useful for local dev/testing)
     env_token = os.getenv("FB_TOKEN")
     if env_token:
-        print("📌 Using FB_TOKEN from environment variable")
+        logger.info("📌 Using FB_TOKEN from environment variable")
         return env_token
 
-    # Get app credentials
+    # Get current token
     try:
-        app_id = get_secret(FB_APP_ID_SECRET)
-        app_secret = get_secret(FB_APP_SECRET_SECRET)
+        current_token = get_secret(TOKEN_SECRET_NAME)
     except Exception as e:
         raise RuntimeError(
-            f"Failed to get Facebook app credentials from Secret Manager: {e}\n"
-            f"Make sure secrets '{FB_APP_ID_SECRET}' and '{FB_APP_SECRET_SECRET}' exist."
+            f"Failed to get Facebook token from Secret Manager: {e}\n"
+            f"Make sure secret '{TOKEN_SECRET_NAME}' exists with a valid token."
         )
 
-    # Get current token
+    # Reuse a recently validated token without the app credentials and
+    # debug_token round-trip. The cache is keyed by the token's fingerprint,
+    # so a token rotated in Secret Manager is always revalidated.
+    if load_cached_token(current_token):
+        logger.info("✅ Using recently validated token from cache")
+        return current_token
+
+    # Get app credentials
     try:
-        current_token = get_secret(TOKEN_SECRET_NAME)
+        app_id = get_secret(FB_APP_ID_SECRET)
+        app_secret = get_secret(FB_APP_SECRET_SECRET)
     except Exception as e:
         raise RuntimeError(
-            f"Failed to get Facebook token from Secret Manager: {e}\n"
-            f"Make sure secret '{TOKEN_SECRET_NAME}' exists with a valid token."
+            f"Failed to get Facebook app credentials from Secret Manager: {e}\n"
+            f"Make sure secrets '{FB_APP_ID_SECRET}' and '{FB_APP_SECRET_SECRET}' exist."
         )
 
     # Check token status
@@ -199,18 +345,19 @@ def get_valid_token() -> str:
 
     # expires_at = 0 means never expires (system user token)
     if expires_at == 0:
-        print("✅ Token never expires (system user token)")
+        logger.info("✅ Token never expires (system user token)")
+        save_cached_token(current_token, expires_at)
         return current_token
 
     expires_dt = datetime.fromtimestamp(expires_at)
     now = datetime.now()
     days_until_expiry = (expires_dt - now).days
 
-    print(f"📅 Token expires: {expires_dt.isoformat()} ({days_until_expiry} days remaining)")
+    logger.info(f"📅 Token expires: {expires_dt.isoformat()} ({days_until_expiry} days remaining)")
 
-    # Refresh if within 7 days of expiration
-    if days_until_expiry <= 7:
-        print(f"⚠️ Token expiring soon, attempting refresh...")
+    # Refresh if within TOKEN_REFRESH_DAYS of expiration
+    if days_until_expiry <= TOKEN_REFRESH_DAYS:
+        logger.warning(f"⚠️ Token expiring soon, attempting refresh...")
 
         try:
             new_token, new_expires_at = refresh_long_lived_token(
@@ -237,14 +384,15 @@ def get_valid_token() -> str:
                 pass  # Metadata is optional
 
             new_days = (datetime.fromtimestamp(new_expires_at) - now).days
-            print(f"✅ Token refreshed successfully! New expiration: {new_days} days")
+            logger.info(f"✅ Token refreshed successfully! New expiration: {new_days} days")
 
+            save_cached_token(new_token, new_expires_at)
             return new_token
 
         except Exception as e:
             # If refresh fails but token is still valid, use it anyway
             if days_until_expiry > 0:
-                print(f"⚠️ Token refresh failed ({e}), but current token still valid for {days_until_expiry} days")
+                logger.warning(f"⚠️ Token refresh failed ({e}), but current token still valid for {days_until_expiry} days")
                 return current_token
             else:
                 raise RuntimeError(
@@ -252,6 +400,7 @@ def get_valid_token() -> str:
                     "You need to manually generate a new token."
                 )
 
+    save_cached_token(current_token, expires_at)
     return current_token
 
 
@@ -259,6 +408,20 @@ def get_valid_token() -> str:
 # FACEBOOK API FUNCTIONS
 # =============================================================================
 
+# Graph API error codes meaning the access token itself is bad (invalid or
+# expired, session key invalid, access token expired/revoked), so the cached
+# token must not be reused
+FB_TOKEN_ERROR_CODES = frozenset({102, 104, 190, 463})
+
+
+def graph_error_code(body):
+    """Return the Graph API error code from a response body, or None."""
+    try:
+        return orjson.loads(body)["error"]["code"]
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
 def fetch_all_insights(token, account_id):
     """
     Fetch Facebook Ads insights for yesterday, broken down by publisher platform.
@@ -291,53 +454,52 @@ def fetch_all_insights(token, account_id):
         "date_preset": "yesterday"
     }
     all_data = []
-    max_retries = 3
     timeout = 30
 
     while url:
-        for attempt in range(max_retries):
-            try:
-                print(f"  Fetching data from account {account_id} (attempt {attempt + 1}/{max_retries})")
-                resp = requests.get(url, params=params, timeout=timeout)
+        body = None
+        try:
+            logger.debug("  Fetching data from account %s", account_id)
+            # Stream the body and hand the raw bytes to orjson in one read,
+            # skipping requests' chunked .content buffering. The body is read
+            # before raise_for_status so error responses can be inspected.
+            with SESSION.get(url, params=params, timeout=timeout, stream=True) as resp:
+                body = resp.raw.read(decode_content=True)
                 resp.raise_for_status()
-                result = resp.json()
-
-                if "error" in result:
-                    error_msg = result["error"].get("message", "Unknown error")
-                    error_type = result["error"].get("type", "Unknown")
-                    error_code = result["error"].get("code", "Unknown")
-                    print(f"❌ Facebook API Error [{error_code}] ({error_type}): {error_msg}")
-                    if error_code in [190, 104]:
-                        print(f"⚠️ TOKEN ERROR: Token may be expired or invalid for account {account_id}")
-                    raise RuntimeError(f"Facebook API Error [{error_code}]: {error_msg}")
-
-                page = result.get("data", [])
-                if not page:
-                    print("  No data returned from API")
-                    break
-
-                all_data.extend(page)
-                print(f"  ✅ Successfully fetched {len(page)} records")
-
-                url = result.get("paging", {}).get("next")
-                params = {}
-                break
-
-            except requests.Timeout:
-                if attempt == max_retries - 1:
-                    print(f"❌ Request timed out after {max_retries} attempts")
-                    raise
-                print(f"⚠️ Request timed out, retrying...")
-                continue
-
-            except requests.RequestException as e:
-                print(f"❌ Request failed: {str(e)}")
-                if hasattr(e, 'response') and hasattr(e.response, 'status_code'):
-                    if e.response.status_code == 401:
-                        print(f"⚠️ TOKEN ERROR: 401 Unauthorized")
-                    elif e.response.status_code == 403:
-                        print(f"⚠️ PERMISSION ERROR: 403 Forbidden")
-                raise
+            result = orjson.loads(body)
+        except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+            logger.error(f"❌ Request failed: {str(e)}")
+            if hasattr(e, 'response') and hasattr(e.response, 'status_code'):
+                # Facebook reports expired/revoked tokens as HTTP 400 with
+                # an OAuth error code in the body
+                error_code = graph_error_code(body)
+                if e.response.status_code == 401 or error_code in FB_TOKEN_ERROR_CODES:
+                    logger.warning(f"⚠️ TOKEN ERROR [{error_code}]: Token may be expired or invalid for account {account_id}")
+                    clear_cached_token()
+                elif e.response.status_code == 403:
+                    logger.warning(f"⚠️ PERMISSION ERROR: 403 Forbidden")
+            raise
+
+        if "error" in result:
+            error_msg = result["error"].get("message", "Unknown error")
+            error_type = result["error"].get("type", "Unknown")
+            error_code = result["error"].get("code", "Unknown")
+            logger.error(f"❌ Facebook API Error [{error_code}] ({error_type}): {error_msg}")
+            if error_code in FB_TOKEN_ERROR_CODES:
+                logger.warning(f"⚠️ TOKEN ERROR: Token may be expired or invalid for account {account_id}")
+                clear_cached_token()
+            raise RuntimeError(f"Facebook API Error [{error_code}]: {error_msg}")
+
+        page = result.get("data", [])
+        if not page:
+            logger.debug("  No data returned from API")
+            break
+
+        all_data.extend(page)
+        logger.debug("  ✅ Successfully fetched %d records", len(page))
+
+        url = result.get("paging", {}).get("next")
+        params = {}
 
     return all_data
 
@@ -349,17 +511,35 @@ def fetch_all_insights(token, account_id):
 def extract_metric(rec, key, is_float=False):
     """Extract metric value from nested Facebook API response."""
     val = rec.get(key, 0)
-    if isinstance(val, list):
+    if type(val) is list:
         raw = val[0].get("value", 0)
     else:
         raw = val
     return float(raw) if is_float else int(raw)
 
 
-def flatten_record(rec, action_types):
+# Fixed columns produced by flatten_record, in output order (action columns follow)
+BASE_FIELDS = [
+    "campaign_name", "ad_name", "publisher_platform", "impressions", "clicks",
+    "spend", "date_start", "date_stop", "video_continuous_2_sec_watched_actions",
+    "video_30_sec_watched_actions", "video_avg_time_watched_actions",
+    "video_p25_watched_actions", "video_p50_watched_actions",
+    "video_p75_watched_actions", "video_p100_watched_actions",
+]
+
+
+# Fields identifying a unique insights row; itemgetter builds the key tuple in C
+DEDUP_KEY_FIELDS = ("campaign_name", "ad_name", "date_start", "publisher_platform")
+_dedup_key = itemgetter(*DEDUP_KEY_FIELDS)
+
+
+def flatten_record(rec, action_cols):
     """
     Flatten nested Facebook API response into a flat dictionary.
     Extracts all metrics and actions into column-friendly format.
+
+    action_cols maps each action type to its column name (see
+    build_action_cols), so column names are computed once per run.
     """
     flat = {
         "campaign_name": rec.get("campaign_name"),
@@ -380,46 +560,59 @@ def flatten_record(rec, action_types):
     }
 
     # Initialize all action types with 0
-    for at in action_types:
-        col = at.replace(".", "_")
+    for col in action_cols.values():
         if col not in flat:
             flat[col] = 0
 
     # Fill in actual action values
-    for act in rec.get("actions", []):
-        col = act["action_type"].replace(".", "_")
-        flat[col] = int(act.get("value", 0))
+    for act in rec.get("actions") or ():
+        flat[action_cols[act["action_type"]]] = int(act.get("value", 0))
 
     return flat
 
 
+def build_action_cols(action_types):
+    """
+    Map action types to column names ('.' becomes '_'), ordered by column
+    name so the output column order is the same on every run.
+    """
+    return dict(sorted(
+        ((at, at.replace(".", "_")) for at in action_types),
+        key=lambda pair: pair[1]
+    ))
+
+
 # =============================================================================
 # BIGQUERY FUNCTIONS
 # =============================================================================
 
-def ensure_bq_schema(table_id: str, rows: list[dict]):
+# Expected static fields, and the subset stored as STRING (everything else is FLOAT)
+_STATIC_KEYS = frozenset(BASE_FIELDS)
+_STRING_FIELDS = frozenset({"ad_name", "campaign_name", "publisher_platform", "date_start", "date_stop"})
+
+
+def ensure_bq_schema(table_id: str, rows: list[dict], fields: list[str] | None = None):
     """
     Dynamically update BigQuery table schema to include any new fields from the data.
     This allows the schema to evolve as Facebook adds new metrics.
+
+    Pass fields when every row's columns are already known (e.g. the flattened
+    header) to skip scanning each row's keys.
     """
-    client = bigquery.Client()
+    client = get_bq_client()
     table = client.get_table(table_id)
     existing = {f.name for f in table.schema}
 
-    all_keys = set().union(*(r.keys() for r in rows))
-
-    # Define expected static fields
-    static_keys = {
-        "campaign_name", "ad_name", "publisher_platform", "date_start", "date_stop",
-        "impressions", "clicks", "spend", "video_continuous_2_sec_watched_actions",
-        "video_30_sec_watched_actions", "video_avg_time_watched_actions",
-        "video_p25_watched_actions", "video_p50_watched_actions",
-        "video_p75_watched_actions", "video_p100_watched_actions"
-    }
+    # Known column names make this O(columns); otherwise scan every row
+    if fields is not None:
+        all_keys = set(fields)
+    else:
+        all_keys = set()
+        for r in rows:
+            all_keys.update(r)
 
-    missing_static = static_keys - existing
-    new_fields = (all_keys - existing) - static_keys
-    to_add = sorted(missing_static | new_fields)
+    # Missing static columns plus any new columns from the data
+    to_add = sorted((all_keys | _STATIC_KEYS) - existing)
 
     if not to_add:
         return
@@ -427,7 +620,7 @@ def ensure_bq_schema(table_id: str, rows: list[dict]):
     new_schema = list(table.schema)
     for name in to_add:
         # String fields
-        if name in ["ad_name", "campaign_name", "publisher_platform", "date_start", "date_stop"]:
+        if name in _STRING_FIELDS:
             field_type = "STRING"
         else:
             field_type = "FLOAT"
@@ -435,16 +628,222 @@ def ensure_bq_schema(table_id: str, rows: list[dict]):
 
     table.schema = new_schema
     client.update_table(table, ["schema"])
-    print(f"✅ Added new fields to {table_id}: {to_add}")
+    logger.info(f"✅ Added new fields to {table_id}: {to_add}")
+
+
+def bq_row_id(row):
+    """
+    Stable streaming insertId for a row, derived from its dedup key.
+
+    BigQuery drops rows whose insertId it has seen in the last minute or so,
+    so a retried insert request doesn't double-insert. main() deduplicates on
+    the same key, so it is unique within a run.
+    """
+    key = "|".join(str(row.get(field)) for field in DEDUP_KEY_FIELDS)
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def insert_rows_orjson(client, table_id, rows, row_ids):
+    """
+    Streaming insert equivalent to client.insert_rows_json, with the request
+    body encoded by orjson.
+
+    Returns errors in the same format as insert_rows_json.
+    """
+    table_ref = bigquery.TableReference.from_string(table_id, default_project=client.project)
+    payload = {
+        "rows": [{"insertId": row_id, "json": row} for row_id, row in zip(row_ids, rows)]
+    }
+    # Every row has an insertId, so retrying the request is safe
+    api_request = bigquery.DEFAULT_RETRY(client._connection.api_request)
+    response = api_request(
+        method="POST",
+        path=f"{table_ref.path}/insertAll",
+        data=orjson.dumps(payload),
+        content_type="application/json",
+    )
+    return [
+        {"index": int(error["index"]), "errors": error["errors"]}
+        for error in response.get("insertErrors", ())
+    ]
 
 
-def insert_to_bq(rows, table_id):
-    """Insert rows into BigQuery table."""
-    errors = get_bq_client().insert_rows_json(table_id, rows)
+def insert_to_bq(rows, table_id, batch_size=BQ_BATCH_SIZE):
+    """
+    Insert rows into BigQuery table in chunks of batch_size.
+
+    Each chunk is a separate streaming insert request, keeping requests well
+    under the 50,000-row limit. Rows carry insertIds from bq_row_id so
+    retries are deduplicated server-side. Errors from all chunks are collected
+    (with row indexes relative to the full list) and raised together at the end.
+    """
+    client = get_bq_client()
+    errors = []
+    for start in range(0, len(rows), batch_size):
+        chunk = rows[start:start + batch_size]
+        row_ids = [bq_row_id(r) for r in chunk]
+        if USE_ORJSON:
+            chunk_errors = insert_rows_orjson(client, table_id, chunk, row_ids)
+        else:
+            chunk_errors = client.insert_rows_json(table_id, chunk, row_ids=row_ids)
+        errors.extend({**err, "index": err["index"] + start} for err in chunk_errors)
+
     if errors:
         raise RuntimeError(f"BigQuery insert errors: {errors}")
     else:
-        print(f"✅ Inserted {len(rows)} rows into {table_id}")
+        logger.info(f"✅ Inserted {len(rows)} rows into {table_id}")
+
+
+def insert_to_bq_load(rows, table_id):
+    """
+    Append rows to BigQuery with a batch load job (newline-delimited JSON).
+
+    Load jobs are free and handle large volumes in one job, unlike streaming
+    inserts which are billed per row. Call ensure_bq_schema first: the job
+    appends using the table's existing schema.
+    """
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        # Always load against the table's schema; older clients otherwise
+        # autodetect from the JSON rows
+        autodetect=False,
+    )
+    load_job = get_bq_client().load_table_from_json(rows, table_id, job_config=job_config)
+    load_job.result()
+    logger.info(f"✅ Loaded {load_job.output_rows} rows into {table_id}")
+
+
+def insert_to_bq_parquet(rows, table_id):
+    """
+    Append rows to BigQuery with a Parquet batch load job.
+
+    Rows are encoded column-wise into an in-memory Parquet file, which is
+    smaller and cheaper for BigQuery to parse than NDJSON. Columns are cast
+    to the table's existing types and modes (see cast_to_table_types), so a
+    REQUIRED column stays required; a missing value there fails the cast
+    before anything is uploaded. Call ensure_bq_schema first.
+    """
+    client = get_bq_client()
+    table = cast_to_table_types(client, pa.Table.from_pylist(rows), table_id)
+
+    buf = io.BytesIO()
+    pq.write_table(table, buf, compression="snappy")
+    buf.seek(0)
+
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        schema_update_options=[bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION],
+    )
+    load_job = client.load_table_from_file(buf, table_id, job_config=job_config)
+    load_job.result()
+    logger.info(f"✅ Loaded {load_job.output_rows} rows into {table_id} from Parquet")
+
+
+# BigQuery column type -> (protobuf field type, value converter) for the
+# Storage Write API. DATE is sent as days since the Unix epoch.
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_PROTO_FIELD_TYPES = {
+    "STRING": (descriptor_pb2.FieldDescriptorProto.TYPE_STRING, str),
+    "FLOAT": (descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE, float),
+    "FLOAT64": (descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE, float),
+    "INTEGER": (descriptor_pb2.FieldDescriptorProto.TYPE_INT64, int),
+    "INT64": (descriptor_pb2.FieldDescriptorProto.TYPE_INT64, int),
+    "BOOLEAN": (descriptor_pb2.FieldDescriptorProto.TYPE_BOOL, bool),
+    "BOOL": (descriptor_pb2.FieldDescriptorProto.TYPE_BOOL, bool),
+    "DATE": (
+        descriptor_pb2.FieldDescriptorProto.TYPE_INT32,
+        lambda v: date.fromisoformat(str(v)).toordinal() - _EPOCH_ORDINAL,
+    ),
+}
+
+
+def build_row_proto(schema):
+    """
+    Build a protobuf message class and descriptor matching a BigQuery schema.
+
+    Returns: (message_class, DescriptorProto, [(field_name, converter), ...])
+    """
+    desc = descriptor_pb2.DescriptorProto(name="AdsRow")
+    converters = []
+    for number, field in enumerate(schema, start=1):
+        if field.field_type not in _PROTO_FIELD_TYPES:
+            raise ValueError(f"Unsupported column type for Storage Write: {field.name} {field.field_type}")
+        proto_type, convert = _PROTO_FIELD_TYPES[field.field_type]
+        desc.field.add(
+            name=field.name,
+            number=number,
+            type=proto_type,
+            label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL,
+        )
+        converters.append((field.name, convert))
+
+    file_proto = descriptor_pb2.FileDescriptorProto(name="ads_row.proto", syntax="proto2")
+    file_proto.message_type.add().CopyFrom(desc)
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    message_class = message_factory.GetMessageClass(pool.FindMessageTypeByName("AdsRow"))
+    return message_class, desc, converters
+
+
+def insert_to_bq_storage(rows, table_id):
+    """
+    Append rows through the BigQuery Storage Write API default stream.
+
+    Rows are encoded as protobuf messages generated from the table schema and
+    sent in AppendRowsRequests of about STORAGE_WRITE_REQUEST_BYTES each.
+    Call ensure_bq_schema first so every row column exists in the table.
+    """
+    table = get_bq_client().get_table(table_id)
+    message_class, desc, converters = build_row_proto(table.schema)
+
+    write_client = get_bq_write_client()
+    stream_name = write_client.table_path(table.project, table.dataset_id, table.table_id) + "/_default"
+    template = bqs_types.AppendRowsRequest(
+        write_stream=stream_name,
+        proto_rows=bqs_types.AppendRowsRequest.ProtoData(
+            writer_schema=bqs_types.ProtoSchema(proto_descriptor=desc)
+        ),
+    )
+    append_stream = bqs_writer.AppendRowsStream(write_client, template)
+
+    def make_request(serialized):
+        return bqs_types.AppendRowsRequest(
+            proto_rows=bqs_types.AppendRowsRequest.ProtoData(
+                rows=bqs_types.ProtoRows(serialized_rows=serialized)
+            )
+        )
+
+    futures = []
+    batch, batch_bytes = [], 0
+    try:
+        for row in rows:
+            msg = message_class()
+            for name, convert in converters:
+                value = row.get(name)
+                if value is not None:
+                    setattr(msg, name, convert(value))
+            data = msg.SerializeToString()
+            if batch and batch_bytes + len(data) > STORAGE_WRITE_REQUEST_BYTES:
+                futures.append(append_stream.send(make_request(batch)))
+                batch, batch_bytes = [], 0
+            batch.append(data)
+            batch_bytes += len(data)
+        if batch:
+            futures.append(append_stream.send(make_request(batch)))
+
+        errors = []
+        for future in futures:
+            response = future.result()
+            errors.extend(response.row_errors)
+    finally:
+        append_stream.close()
+
+    if errors:
+        raise RuntimeError(f"BigQuery Storage Write errors: {errors}")
+    else:
+        logger.info(f"✅ Wrote {len(rows)} rows to {table_id} via Storage Write API")
 
 
 # =============================================================================
@@ -457,13 +856,15 @@ def main(event=None, context=None):
 
     Can be run locally or as a Cloud Function.
     Set DRY_RUN=true to test without inserting to BigQuery.
+    Set WRITE_CSV=false to skip the /tmp/ads_output.csv review file.
     """
     table_id = os.getenv("BQ_TABLE", "your-project.your_dataset.ad_data")
     dry_run = os.getenv("DRY_RUN", "false").lower() == "true"
+    write_csv = os.getenv("WRITE_CSV", "true").lower() == "true"
 
-    print("=" * 60)
-    print("Facebook Ads to BigQuery ETL Pipeline")
-    print("=" * 60)
+    logger.info("=" * 60)
+    logger.info("Facebook Ads to BigQuery ETL Pipeline")
+    logger.info("=" * 60)
 
     # Get valid token (handles refresh automatically)
     token = get_valid_token()
@@ -472,82 +873,118 @@ def main(event=None, context=None):
     all_raw = []
     failed_accounts = []
 
-    # Fetch data from all accounts
-    for account_id in account_ids:
-        try:
-            print(f"\n📊 Fetching insights for account {account_id}...")
-            raw = fetch_all_insights(token, account_id)
-            all_raw.extend(raw)
-            print(f"✅ Successfully processed account {account_id}")
-        except Exception as e:
-            error_msg = str(e)
-            print(f"❌ Failed to process account {account_id}: {error_msg}")
-            failed_accounts.append((account_id, error_msg))
-            continue
+    # Fetch data from all accounts concurrently; results are collected in
+    # account order so dedup keeps the same record as a serial run would
+    workers = max(1, min(FB_CONCURRENCY, len(account_ids)))
+    logger.info(f"\n📊 Fetching insights for {len(account_ids)} account(s) ({workers} at a time)...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (account_id, executor.submit(fetch_all_insights, token, account_id))
+            for account_id in account_ids
+        ]
+        for account_id, future in futures:
+            try:
+                raw = future.result()
+                all_raw.extend(raw)
+                logger.info(f"✅ Successfully processed account {account_id}")
+            except Exception as e:
+                error_msg = str(e)
+                logger.error(f"❌ Failed to process account {account_id}: {error_msg}")
+                failed_accounts.append((account_id, error_msg))
+                continue
 
     if failed_accounts:
-        print(f"\n⚠️ WARNING: {len(failed_accounts)} account(s) failed to process:")
+        logger.warning(f"\n⚠️ WARNING: {len(failed_accounts)} account(s) failed to process:")
         for account_id, error in failed_accounts:
-            print(f"   - {account_id}: {error}")
+            logger.warning(f"   - {account_id}: {error}")
 
     if not all_raw:
-        print("\n⚠️ No data found for any account")
+        logger.warning("\n⚠️ No data found for any account")
         if failed_accounts:
-            print(f"\n⛔ CRITICAL: All {len(account_ids)} account(s) failed to process.")
+            logger.error(f"\n⛔ CRITICAL: All {len(account_ids)} account(s) failed to process.")
             raise RuntimeError(f"Failed to fetch data from all accounts: {failed_accounts}")
         return {"status": "success", "message": "No data found", "rows_processed": 0}
 
     # Deduplicate raw records (Facebook API may return overlapping data)
-    print(f"\n🔍 Deduplicating {len(all_raw)} records...")
+    logger.info(f"\n🔍 Deduplicating {len(all_raw)} records...")
+    # Action types for the schema are collected in the same pass
+    # Presized to the upper bound and trimmed after, avoiding list regrowth
     seen = set()
-    deduped_raw = []
+    deduped_raw = [None] * len(all_raw)
+    j = 0
+    action_types = set()
     for rec in all_raw:
-        # Unique key: campaign_name|ad_name|date_start|publisher_platform
-        key = f"{rec.get('campaign_name')}|{rec.get('ad_name')}|{rec.get('date_start')}|{rec.get('publisher_platform')}"
+        # Unique key: (campaign_name, ad_name, date_start, publisher_platform)
+        try:
+            key = _dedup_key(rec)
+        except KeyError:
+            # Missing fields count as None, as with dict.get
+            key = tuple(map(rec.get, DEDUP_KEY_FIELDS))
         if key not in seen:
             seen.add(key)
-            deduped_raw.append(rec)
+            deduped_raw[j] = rec
+            j += 1
+            action_types.update(a["action_type"] for a in rec.get("actions") or ())
+    del deduped_raw[j:]
 
     duplicates_removed = len(all_raw) - len(deduped_raw)
     if duplicates_removed > 0:
-        print(f"  Removed {duplicates_removed} duplicate records ({len(deduped_raw)} unique)")
+        logger.info(f"  Removed {duplicates_removed} duplicate records ({len(deduped_raw)} unique)")
     else:
-        print(f"  No duplicates found ({len(deduped_raw)} unique records)")
+        logger.info(f"  No duplicates found ({len(deduped_raw)} unique records)")
 
-    # Collect all action types for schema
-    action_types = {a["action_type"]
-                    for r in deduped_raw
-                    for a in r.get("actions", [])}
+    action_cols = build_action_cols(action_types)
 
-    # Flatten all records
-    rows = []
-    for r in deduped_raw:
-        flat = flatten_record(r, action_types)
-        rows.append(flat)
-
-    # Save to CSV for review
-    if rows:
+    # Flatten each record once, streaming it to the review CSV as we go.
+    # Rows are only kept in memory when they'll be inserted to BigQuery.
+    fieldnames = list(dict.fromkeys(BASE_FIELDS + list(action_cols.values())))
+    rows = [] if dry_run else [None] * len(deduped_raw)
+    row_count = 0
+    csv_file = None
+    if write_csv:
         csv_path = "/tmp/ads_output.csv"
-        with open(csv_path, "w", newline="") as f:
-            writer = csv.DictWriter(f, fieldnames=rows[0].keys())
-            writer.writeheader()
-            writer.writerows(rows)
-        print(f"✅ Saved {len(rows)} rows to {csv_path}")
+        csv_file = open(csv_path, "w", newline="")
+        writer = csv.writer(csv_file)
+        writer.writerow(fieldnames)
+        # flatten_record fills every column, so a positional getter is safe
+        row_values = itemgetter(*fieldnames)
+
+    try:
+        for r in deduped_raw:
+            flat = flatten_record(r, action_cols)
+            if csv_file:
+                writer.writerow(row_values(flat))
+            if not dry_run:
+                rows[row_count] = flat
+            row_count += 1
+    finally:
+        if csv_file:
+            csv_file.close()
+
+    if csv_file:
+        logger.info(f"✅ Saved {row_count} rows to {csv_path}")
 
     # Insert to BigQuery
     if dry_run:
-        print("\n🧪 DRY RUN MODE: Skipping BigQuery insertion")
-        print(f"Would have inserted {len(rows)} rows to {table_id}")
+        logger.info("\n🧪 DRY RUN MODE: Skipping BigQuery insertion")
+        logger.info(f"Would have inserted {row_count} rows to {table_id}")
     elif rows:
-        ensure_bq_schema(table_id, rows)
-        insert_to_bq(rows, table_id)
+        ensure_bq_schema(table_id, rows, fieldnames)
+        if USE_STORAGE_WRITE:
+            insert_to_bq_storage(rows, table_id)
+        elif USE_PARQUET_LOAD:
+            insert_to_bq_parquet(rows, table_id)
+        elif len(rows) >= BQ_LOAD_THRESHOLD:
+            insert_to_bq_load(rows, table_id)
+        else:
+            insert_to_bq(rows, table_id)
 
-    print("\n" + "=" * 60)
-    print(f"✅ Pipeline completed successfully!")
-    print(f"Processed {len(rows)} rows")
-    print("=" * 60)
+    logger.info("\n" + "=" * 60)
+    logger.info(f"✅ Pipeline completed successfully!")
+    logger.info(f"Processed {row_count} rows")
+    logger.info("=" * 60)
 
-    return {"status": "success", "message": f"Processed {len(rows)} rows", "rows_processed": len(rows)}
+    return {"status": "success", "message": f"Processed {row_count} rows", "rows_processed": row_count}
 
 
 if __name__ == "__main__":